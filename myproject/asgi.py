@@ -14,3 +14,15 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
 
 application = get_asgi_application()
+
+# Fill URL resolver and serializer caches before the first request. The ASGI
+# server (uvicorn) imports this module in every worker process it starts, so
+# the cost is paid at startup rather than by whoever connects first.
+from newapp.warmup import warm_up  # noqa: E402
+
+warm_up()
+
+# Order status streams are served next to Django, not through its handler.
+from newapp.sse import with_order_events  # noqa: E402
+
+application = with_order_events(application)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'newapp.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -92,6 +94,7 @@ DATABASES = {
     }
 }
 
+AUTH_USER_MODEL = 'newapp.User'
 
 
 # Password validation
@@ -149,5 +152,37 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
 
+# Query budgets (newapp.middleware.QueryBudgetMiddleware)
+# Budget overruns and repeated queries raise under `manage.py test` and are
+# only logged otherwise.
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+QUERY_BUDGET_RAISE = TESTING
+QUERY_BUDGET_REPEAT_THRESHOLD = 3
+
+# Seconds a user's serialized profile stays in the default cache. Profiles
+# are only cached when CACHES points at a backend shared by all workers
+# (Redis, Memcached): with the default per-process LocMemCache, saving a user
+# could not invalidate the copies held by the other gunicorn workers.
+PROFILE_CACHE_TIMEOUT = 60 * 15
+
+# Order status feed (GET /api/orders/<uuid>/events/). The API is served by
+# gunicorn (WSGI, gunicorn.conf.py), but the event streams need an ASGI server:
+#
+#     uvicorn myproject.asgi:application --workers 4
+#
+# with the reverse proxy sending /api/orders/<uuid>/events/ to it (buffering
+# off). DatabaseBroker carries status changes from whichever process saved
+# the order to every ASGI process. LocalBroker only reaches subscribers in
+# the publishing process, so gunicorn refuses to start with it.
+ORDER_FEED_BROKER = 'newapp.orderfeed.LocalBroker' if TESTING else 'newapp.orderfeed.DatabaseBroker'
+# Seconds between DatabaseBroker polls in each ASGI process.
+ORDER_FEED_POLL_INTERVAL = 1
+# Seconds between keep-alive comments on idle streams.
+ORDER_FEED_HEARTBEAT = 15
+# Seconds after which a stream is closed; EventSource reconnects after
+# ORDER_FEED_RETRY seconds (sent as the SSE retry: hint).
+ORDER_FEED_MAX_LIFETIME = 60 * 5
+ORDER_FEED_RETRY = 5
+
 
 
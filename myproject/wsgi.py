@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
 
 application = get_wsgi_application()
+
+# Fill URL resolver and serializer caches before the first request; under
+# gunicorn --preload this runs once in the master and workers inherit it.
+from newapp.warmup import warm_up  # noqa: E402
+
+warm_up()
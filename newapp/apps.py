@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class NewappConfig(AppConfig):
     name = 'newapp'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,59 @@
+import time
+
+from django.contrib.auth.models import Group
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+# Group names never change at runtime, so their ids are looked up once per
+# process instead of on every signup. Cleared whenever a Group is saved or
+# deleted and after migrations.
+_group_ids = {}
+
+
+def profile_cache_key(user_id, version):
+    return f'profile:{user_id}:{version}'
+
+
+def profile_version_key(user_id):
+    return f'profile-version:{user_id}'
+
+
+def get_profile_version(profile_cache, user_id):
+    # A fresh version starts at the current time, so entries cached under an
+    # evicted version key can't become current again.
+    return profile_cache.get_or_set(profile_version_key(user_id), time.time_ns, None)
+
+
+def bump_profile_version(profile_cache, user_id):
+    """
+    Move the user's profile to a new cache key. Unlike deleting the entry,
+    this also defeats a GET that serialized the user before the save and
+    stores its copy afterwards: it lands under the old version.
+    """
+    try:
+        profile_cache.incr(profile_version_key(user_id))
+    except ValueError:
+        profile_cache.set(profile_version_key(user_id), time.time_ns(), None)
+
+
+def get_profile_cache():
+    """
+    Return the cache for serialized profiles, or None if the default cache is
+    process-local: with several workers, the invalidation done by the worker
+    that saved a user would leave stale copies in the others.
+    """
+    cache = caches['default']
+    return None if isinstance(cache, LocMemCache) else cache
+
+
+def get_group_id(name):
+    try:
+        return _group_ids[name]
+    except KeyError:
+        group, _ = Group.objects.get_or_create(name=name)
+        _group_ids[name] = group.pk
+        return group.pk
+
+
+def clear_group_ids():
+    _group_ids.clear()
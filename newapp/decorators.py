@@ -17,3 +17,15 @@ def role_required(allowed_roles=[]):
             return Response({"error": "Permission denied"}, status=status.HTTP_403_FORBIDDEN)
         return _wrapped_view
     return decorator
+
+
+def query_budget(default=None, **methods):
+    """
+    Declare how many queries a view may run, for QueryBudgetMiddleware.
+    ``@query_budget(3)`` applies to every method, ``@query_budget(GET=2, POST=4)``
+    per method. Put it above ``@api_view`` so it decorates the final view.
+    """
+    def decorator(view_func):
+        view_func.query_budgets = {None: default, **methods}
+        return view_func
+    return decorator
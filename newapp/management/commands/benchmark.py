@@ -0,0 +1,341 @@
+import asyncio
+import http.client
+import itertools
+import json
+import os
+import random
+import re
+import resource
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from newapp.cache import get_group_id
+from newapp.models import Order, User
+
+FIRST_RESPONSE_LINE = re.compile(r'Worker (\d+) first response after ([\d.]+) ms')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def summarize(samples):
+    return (
+        f'n={len(samples)} median={statistics.median(samples):.1f} ms '
+        f'max={max(samples):.1f} ms'
+    )
+
+
+def children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def raise_open_file_limit():
+    # Every subscriber holds a socket on both ends; servers started from here inherit the limit.
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+async def http_request(port, method, path, token, body=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    payload = json.dumps(body).encode() if body is not None else b''
+    writer.write(
+        f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAuthorization: Bearer {token}\r\n'
+        f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n'.encode()
+        + payload
+    )
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), content
+
+
+class GunicornServer:
+    """Runs gunicorn with the project's gunicorn.conf.py and collects its log."""
+
+    def __init__(self, port, workers, preload):
+        self.port = port
+        env = {
+            **os.environ,
+            'GUNICORN_BIND': f'127.0.0.1:{port}',
+            'GUNICORN_WORKERS': str(workers),
+            'GUNICORN_PRELOAD': '1' if preload else '0',
+        }
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        self.first_responses = {}
+        self.changed = threading.Condition()
+        threading.Thread(target=self._read_log, daemon=True).start()
+
+    def _read_log(self):
+        for line in self.process.stderr:
+            match = FIRST_RESPONSE_LINE.search(line)
+            if match:
+                with self.changed:
+                    self.first_responses[int(match.group(1))] = float(match.group(2))
+                    self.changed.notify_all()
+
+    def wait_for_first_responses(self, count, timeout=60):
+        with self.changed:
+            if not self.changed.wait_for(lambda: len(self.first_responses) >= count, timeout):
+                raise CommandError(f'Only {len(self.first_responses)} of {count} workers responded within {timeout}s')
+
+    def stop(self):
+        self.process.send_signal(signal.SIGTERM)
+        self.process.wait()
+
+
+class UvicornServer:
+    """Runs the ASGI application under uvicorn (single worker)."""
+
+    def __init__(self, port):
+        self.port = port
+        self.process = subprocess.Popen(
+            [
+                sys.executable, '-m', 'uvicorn', 'myproject.asgi:application',
+                '--host', '127.0.0.1', '--port', str(port),
+                '--backlog', '4096', '--log-level', 'warning', '--no-access-log',
+            ],
+            cwd=settings.BASE_DIR,
+        )
+
+    def wait_until_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise CommandError(f'uvicorn did not start within {timeout}s')
+
+    def rss_mb(self):
+        try:
+            with open(f'/proc/{self.process.pid}/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    def stop(self):
+        self.process.send_signal(signal.SIGTERM)
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class LoadGenerator:
+    """Keeps a few connections busy so every live worker gets requests."""
+
+    def __init__(self, port, path, concurrency):
+        self.port = port
+        self.path = path
+        self.running = True
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(concurrency)]
+        for thread in self.threads:
+            thread.start()
+
+    def _run(self):
+        while self.running:
+            connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+            try:
+                connection.request('GET', self.path)
+                connection.getresponse().read()
+            except OSError:
+                time.sleep(0.01)
+            finally:
+                connection.close()
+
+    def stop(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join()
+
+
+class Command(BaseCommand):
+    help = 'Run a benchmark scenario against a local gunicorn server.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=['startup', 'orderfeed'])
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--restarts', type=int, default=5, help='Worker restarts to measure per mode.')
+        parser.add_argument('--path', default='/api/products/', help='URL requested by the load generator.')
+        parser.add_argument('--clients', type=int, default=500, help='Clients watching one order (orderfeed).')
+        parser.add_argument('--updates', type=int, default=5, help='Status changes to publish (orderfeed).')
+        parser.add_argument('--update-interval', type=float, default=2.0, help='Seconds between status changes.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls per client.')
+        parser.add_argument('--modes', nargs='+', choices=['sse', 'poll'], default=['sse', 'poll'])
+
+    def handle(self, *args, **options):
+        getattr(self, f'run_{options["scenario"]}')(**options)
+
+    # --- Scenarios ---
+
+    def run_startup(self, workers, restarts, path, **options):
+        """
+        Time-to-first-response per worker, measured from fork by the
+        post_fork/post_request hooks in gunicorn.conf.py, for the initial
+        workers and for workers respawned after a restart.
+        """
+        for preload in (True, False):
+            port = free_port()
+            server = GunicornServer(port, workers, preload)
+            load = LoadGenerator(port, path, concurrency=workers * 2)
+            try:
+                server.wait_for_first_responses(workers)
+                initial = list(server.first_responses.values())
+
+                killed = set()
+                for restart in range(restarts):
+                    pid = next(pid for pid in server.first_responses if pid not in killed)
+                    killed.add(pid)
+                    os.kill(pid, signal.SIGTERM)
+                    server.wait_for_first_responses(workers + restart + 1)
+                respawned = list(server.first_responses.values())[workers:]
+            finally:
+                load.stop()
+                server.stop()
+
+            mode = 'preload' if preload else 'no preload'
+            self.stdout.write(f'{mode:>10}  initial workers:   {summarize(initial)}')
+            if respawned:
+                self.stdout.write(f'{mode:>10}  respawned workers: {summarize(respawned)}')
+
+    def run_orderfeed(self, clients, updates, update_interval, poll_interval, modes, **options):
+        """
+        Clients watching one order while a manager changes its status: SSE
+        subscribers (GET /api/orders/<id>/events/) against clients polling
+        GET /api/orders/<id>/. Reports requests served, changes seen, latency
+        from the status PATCH to the client noticing it, and uvicorn's CPU
+        time and memory. Creates a throwaway manager, customer and order in
+        the configured database and deletes them afterwards.
+        """
+        limit = raise_open_file_limit()
+        if clients + 100 > limit:
+            raise CommandError(f'{clients} clients need more than the {limit} open files allowed')
+
+        manager = User.objects.create_user(username=f'bench-manager-{os.getpid()}')
+        User.groups.through.objects.create(user_id=manager.pk, group_id=get_group_id('Manager'))
+        customer = User.objects.create_user(username=f'bench-customer-{os.getpid()}')
+        order = Order.objects.create(user=customer)
+        manager_token = str(RefreshToken.for_user(manager).access_token)
+        customer_token = str(RefreshToken.for_user(customer).access_token)
+        try:
+            for mode in modes:
+                Order.objects.filter(pk=order.pk).update(status='pending')
+                port = free_port()
+                cpu_before = children_cpu_seconds()
+                server = UvicornServer(port)
+                try:
+                    server.wait_until_ready()
+                    result = asyncio.run(self._orderfeed_round(
+                        mode, server, order.pk, manager_token, customer_token,
+                        clients, updates, update_interval, poll_interval,
+                    ))
+                finally:
+                    server.stop()
+                result['cpu'] = children_cpu_seconds() - cpu_before
+                self._report_orderfeed(mode, clients, updates, result)
+        finally:
+            customer.delete()
+            manager.delete()
+
+    async def _orderfeed_round(self, mode, server, order_id, manager_token, customer_token,
+                               clients, updates, update_interval, poll_interval):
+        port = server.port
+        stop = asyncio.Event()
+        observed = [[] for _ in range(clients)]
+        requests = itertools.count()
+
+        async def subscriber(changes):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(
+                f'GET /api/orders/{order_id}/events/ HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+                f'Authorization: Bearer {customer_token}\r\nAccept: text/event-stream\r\n\r\n'.encode()
+            )
+            next(requests)
+            try:
+                while not stop.is_set():
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    if line.startswith(b'data: '):
+                        changes.append((json.loads(line[6:])['status'], time.monotonic()))
+            finally:
+                writer.close()
+
+        async def poller(changes):
+            await asyncio.sleep(random.uniform(0, poll_interval))
+            last = None
+            while not stop.is_set():
+                next(requests)
+                code, content = await http_request(port, 'GET', f'/api/orders/{order_id}/', customer_token)
+                if code == 200:
+                    current = json.loads(content)['status']
+                    if current != last:
+                        changes.append((current, time.monotonic()))
+                        last = current
+                await asyncio.sleep(poll_interval)
+
+        client = subscriber if mode == 'sse' else poller
+        tasks = [asyncio.create_task(client(changes)) for changes in observed]
+        # Every client has to know the initial status before the first change.
+        while not all(observed) and not any(task.done() for task in tasks):
+            await asyncio.sleep(0.05)
+        rss = server.rss_mb()
+
+        sent = []
+        for new_status in itertools.islice(itertools.cycle(['paid', 'shipped', 'pending']), updates):
+            await asyncio.sleep(update_interval)
+            sent.append((new_status, time.monotonic()))
+            await http_request(port, 'PATCH', f'/api/orders/{order_id}/status/', manager_token, {'status': new_status})
+        await asyncio.sleep(max(update_interval, poll_interval))
+
+        stop.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        latencies = []
+        for changes in observed:
+            for (expected, sent_at), (seen, seen_at) in zip(sent, changes[1:]):
+                if expected == seen:
+                    latencies.append((seen_at - sent_at) * 1000)
+        return {'requests': next(requests), 'latencies': latencies, 'rss': rss}
+
+    def _report_orderfeed(self, mode, clients, updates, result):
+        latencies = sorted(result['latencies'])
+        line = (
+            f'{mode:>5}  clients={clients} client requests={result["requests"]} '
+            f'changes seen={len(latencies)}/{clients * updates}'
+        )
+        if latencies:
+            p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+            line += f' latency median={statistics.median(latencies):.1f} ms p95={p95:.1f} ms'
+        line += f' server cpu={result["cpu"]:.2f}s'
+        if result['rss'] is not None:
+            line += f' server rss={result["rss"]:.0f} MB'
+        self.stdout.write(line)
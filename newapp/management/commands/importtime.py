@@ -0,0 +1,64 @@
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Same import path a gunicorn worker takes before serving its first request.
+STARTUP_SCRIPT = 'import myproject.wsgi'
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)$')
+
+
+class Command(BaseCommand):
+    help = 'Profile the imports done while loading the WSGI application (python -X importtime).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=25, help='Number of modules to show.')
+        parser.add_argument(
+            '--sort',
+            choices=['cumulative', 'self'],
+            default='cumulative',
+            help='Order modules by cumulative time (including their imports) or self time.',
+        )
+        parser.add_argument(
+            '--by-package',
+            action='store_true',
+            help='Sum self time per top-level package (django, rest_framework, ...).',
+        )
+
+    def handle(self, *args, **options):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            capture_output=True,
+            text=True,
+            cwd=settings.BASE_DIR,
+        )
+        if result.returncode != 0:
+            raise CommandError(f'Importing the WSGI application failed:\n{result.stderr}')
+
+        rows = []
+        total_us = 0
+        for line in result.stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if not match:
+                continue
+            self_us, cumulative_us, module = int(match.group(1)), int(match.group(2)), match.group(3)
+            total_us += self_us
+            rows.append((self_us, cumulative_us, module))
+
+        if options['by_package']:
+            packages = {}
+            for self_us, _, module in rows:
+                package = module.split('.')[0]
+                packages[package] = packages.get(package, 0) + self_us
+            rows = [(self_us, self_us, package) for package, self_us in packages.items()]
+
+        key = 1 if options['sort'] == 'cumulative' else 0
+        rows.sort(key=lambda row: row[key], reverse=True)
+
+        self.stdout.write(f'{"self ms":>10} {"cumul ms":>10}  module')
+        for self_us, cumulative_us, module in rows[:options['limit']]:
+            self.stdout.write(f'{self_us / 1000:>10.1f} {cumulative_us / 1000:>10.1f}  {module}')
+        self.stdout.write(f'\nTotal import time: {total_us / 1000:.1f} ms')
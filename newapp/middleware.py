@@ -0,0 +1,40 @@
+import logging
+
+from django.conf import settings
+
+from .querybudget import IGNORED_FILES, QueryBudgetExceeded, QueryRecorder
+
+logger = logging.getLogger(__name__)
+
+IGNORED_FILES.add(__file__)
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts the queries of every request, checks them against the view's
+    ``@query_budget`` and looks for repeated query fingerprints (N+1).
+
+    Violations raise ``QueryBudgetExceeded`` when QUERY_BUDGET_RAISE is set
+    (tests, CI) and are logged as warnings otherwise.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+
+        budgets = getattr(request, '_query_budgets', None) or {}
+        budget = budgets.get(request.method, budgets.get(None))
+        problems = recorder.problems(budget)
+        if problems:
+            message = f'{request.method} {request.path}:\n' + '\n'.join(problems)
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning('Query budget exceeded for %s', message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budgets = getattr(view_func, 'query_budgets', None)
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+DEFAULT_GROUPS = ['Customer', 'Manager']
+
+
+def create_default_groups(apps, schema_editor):
+    Group = apps.get_model('auth', 'Group')
+    for name in DEFAULT_GROUPS:
+        Group.objects.get_or_create(name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('newapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_default_groups, migrations.RunPython.noop),
+    ]
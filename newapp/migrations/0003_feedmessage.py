@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newapp', '0002_default_groups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedMessage',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('channel', models.CharField(max_length=100)),
+                ('message', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -1,6 +1,5 @@
 import uuid
 from django.db import models
-from django.contrib.auth.models import User
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 
@@ -22,9 +21,6 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
-    def __str__(self):
-        return self.user.username
-
 
 # =========================
 # PRODUCT
@@ -141,3 +137,18 @@ class Wishlist(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
+
+
+# =========================
+# ORDER FEED
+# =========================
+class FeedMessage(models.Model):
+    # Messages passed between processes by newapp.orderfeed.DatabaseBroker.
+    # The auto-incrementing id orders them for the pollers.
+    id = models.BigAutoField(primary_key=True)
+    channel = models.CharField(max_length=100)
+    message = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.channel} #{self.id}"
@@ -0,0 +1,269 @@
+"""
+Pub/sub for order status changes, consumed by the server-sent events stream
+in ``newapp.sse``.
+
+Every process has one ``Hub`` that fans messages out to the subscribers
+connected to it. The broker configured in ORDER_FEED_BROKER decides how a
+published message reaches the hubs:
+
+- ``DatabaseBroker`` writes it to the FeedMessage table, which every process
+  with subscribers polls. This is what a deployment needs: status changes
+  are saved by the gunicorn (WSGI) workers, the admin or a shell, while the
+  streams live in the ASGI processes.
+- ``LocalBroker`` hands it straight to the hub of the publishing process.
+  That only works when one process serves both the API and the streams
+  (tests, a single ``uvicorn`` without ``--workers``).
+
+Another bus (Redis pub/sub, ...) subclasses ``Broker``: ``publish()`` sends
+to the bus, ``start()`` begins receiving from it and calls
+``self.hub.dispatch()`` for every message.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import FeedMessage
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    Mailbox of one subscriber. It only keeps the latest undelivered message,
+    so a slow or idle client costs the same memory however many updates it
+    misses.
+    """
+
+    __slots__ = ('hub', 'channel', 'closed', '_loop', '_message', '_waiter')
+
+    def __init__(self, hub, channel):
+        self.hub = hub
+        self.channel = channel
+        # Set by Hub.close_all(); the subscriber should end its stream.
+        self.closed = False
+        self._loop = asyncio.get_running_loop()
+        self._message = None
+        self._waiter = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _deliver(self, message):
+        self._message = message
+        self._wake()
+
+    def _shut_down(self):
+        self.closed = True
+        self._wake()
+
+    async def get(self, timeout=None):
+        """
+        Wait for the next message; return None if ``timeout`` expires first
+        or the hub is closed.
+        """
+        if self._message is None and not self.closed:
+            self._waiter = self._loop.create_future()
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self._waiter = None
+        message, self._message = self._message, None
+        return message
+
+
+def _deliver_all(subscriptions, message):
+    for subscription in subscriptions:
+        subscription._deliver(message)
+
+
+def _shut_down_all(subscriptions):
+    for subscription in subscriptions:
+        subscription._shut_down()
+
+
+class Hub:
+    """Subscribers of this process, grouped by channel."""
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def subscribe(self, channel):
+        """Subscribe to ``channel``; must be called from the subscriber's event loop."""
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+            subscription.closed = self._closed
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._channels.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._channels[subscription.channel]
+
+    def dispatch(self, channel, message):
+        """Deliver ``message`` to the channel's subscribers; safe to call from any thread."""
+        with self._lock:
+            subscriptions = tuple(self._channels.get(channel, ()))
+        self._call_per_loop(subscriptions, _deliver_all, message)
+
+    def close_all(self):
+        """
+        Wake every subscriber with ``closed`` set, now and for later
+        subscriptions, so their streams end and the server can shut down.
+        Safe to call from any thread.
+        """
+        with self._lock:
+            self._closed = True
+            subscriptions = tuple(
+                subscription for subscriptions in self._channels.values() for subscription in subscriptions
+            )
+        self._call_per_loop(subscriptions, _shut_down_all)
+
+    def _call_per_loop(self, subscriptions, callback, *args):
+        # One wake-up per event loop rather than one per subscriber.
+        by_loop = {}
+        for subscription in subscriptions:
+            by_loop.setdefault(subscription._loop, []).append(subscription)
+        for loop, loop_subscriptions in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(callback, loop_subscriptions, *args)
+            except RuntimeError:
+                # The subscribers' event loop is gone.
+                for subscription in loop_subscriptions:
+                    self.unsubscribe(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._channels.values())
+
+
+class Broker:
+    """Carries published messages to the hubs of every process."""
+
+    # Brokers that receive through a background task set this in start().
+    started = True
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def start(self):
+        """
+        Begin receiving messages for this process's hub. Called (off the
+        event loop) before the first subscription of an ASGI process; must
+        be idempotent.
+        """
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+
+class LocalBroker(Broker):
+    """Delivers to the current process only."""
+
+    def publish(self, channel, message):
+        self.hub.dispatch(channel, message)
+
+
+class DatabaseBroker(Broker):
+    """
+    Passes messages through the FeedMessage table. Each started process
+    polls it every ORDER_FEED_POLL_INTERVAL seconds from a background
+    thread: one query per process and interval, however many subscribers.
+    """
+
+    started = False
+    # Ids skipped by the auto-increment are re-checked this long (seconds):
+    # an insert that took its id earlier may commit after a later one.
+    gap_timeout = 5
+    # Messages are only needed until every poller has read them.
+    retention = timedelta(minutes=10)
+
+    def __init__(self, hub):
+        super().__init__(hub)
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._gaps = {}
+        self._pruned_at = None
+
+    def start(self):
+        with self._lock:
+            if self.started:
+                return
+            self._last_id = FeedMessage.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+            threading.Thread(target=self._poll_forever, name='order-feed-poller', daemon=True).start()
+            self.started = True
+
+    def publish(self, channel, message):
+        FeedMessage.objects.create(channel=channel, message=message)
+        now = time.monotonic()
+        if self._pruned_at is None or now - self._pruned_at > self.retention.total_seconds() / 10:
+            self._pruned_at = now
+            FeedMessage.objects.filter(created_at__lt=timezone.now() - self.retention).delete()
+
+    def poll(self):
+        """Dispatch the messages published since the previous poll."""
+        now = time.monotonic()
+        messages = (
+            FeedMessage.objects.filter(Q(id__gt=self._last_id) | Q(id__in=list(self._gaps)))
+            .order_by('id')
+            .values_list('id', 'channel', 'message')
+        )
+        for message_id, channel, message in messages:
+            self._gaps.pop(message_id, None)
+            if message_id > self._last_id:
+                self._gaps.update(dict.fromkeys(range(self._last_id + 1, message_id), now))
+                self._last_id = message_id
+            self.hub.dispatch(channel, message)
+        self._gaps = {
+            message_id: seen_at for message_id, seen_at in self._gaps.items() if now - seen_at < self.gap_timeout
+        }
+
+    def _poll_forever(self):
+        while True:
+            time.sleep(settings.ORDER_FEED_POLL_INTERVAL)
+            try:
+                self.poll()
+            except DatabaseError:
+                logger.exception('Polling the order feed failed')
+            finally:
+                close_old_connections()
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.ORDER_FEED_BROKER)(Hub())
+
+
+def order_channel(order_id):
+    return f'order:{order_id}'
+
+
+def publish_order_status(order):
+    get_broker().publish(order_channel(order.pk), {'id': str(order.pk), 'status': order.status})
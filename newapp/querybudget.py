@@ -0,0 +1,123 @@
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.fields import Field
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+_PROJECT_DIR = str(settings.BASE_DIR)
+# Detector frames are skipped when attributing a query to project code.
+IGNORED_FILES = {__file__}
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """
+    Normalize a SQL statement so that queries differing only in their
+    literals (ids, strings, IN-list length) compare equal.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def _query_origin():
+    """
+    Describe what triggered the current query: the serializer field being
+    rendered (if any) and the innermost line of project code.
+    """
+    field = None
+    line = None
+    frame = sys._getframe(2)
+    while frame is not None and line is None:
+        code = frame.f_code
+        if field is None and code.co_name in ('get_attribute', 'to_representation'):
+            owner = frame.f_locals.get('self')
+            if isinstance(owner, Field) and owner.field_name and owner.parent is not None:
+                field = f'{type(owner.parent).__name__}.{owner.field_name}'
+        filename = code.co_filename
+        if filename.startswith(_PROJECT_DIR) and filename not in IGNORED_FILES and 'site-packages' not in filename:
+            line = f'{Path(filename).relative_to(_PROJECT_DIR)}:{frame.f_lineno} in {code.co_name}'
+        frame = frame.f_back
+    return ' via '.join(part for part in (field, line) if part) or 'unknown'
+
+
+class QueryRecorder:
+    """
+    Records every query run on the current thread's connections while
+    active (see ``record()``), with its fingerprint and origin.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'fingerprint': fingerprint(sql),
+                'origin': _query_origin(),
+                'duration': time.perf_counter() - start,
+            })
+
+    @contextmanager
+    def record(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def repeated(self, threshold):
+        """Return ``[(fingerprint, count, origins)]`` for fingerprints seen at least ``threshold`` times."""
+        counts = Counter(query['fingerprint'] for query in self.queries)
+        return [
+            (sql, count, sorted({q['origin'] for q in self.queries if q['fingerprint'] == sql}))
+            for sql, count in counts.most_common()
+            if count >= threshold
+        ]
+
+    def problems(self, budget=None, threshold=None):
+        """List human-readable budget/N+1 violations; empty if there are none."""
+        if threshold is None:
+            threshold = settings.QUERY_BUDGET_REPEAT_THRESHOLD
+        problems = []
+        if budget is not None and len(self.queries) > budget:
+            problems.append(f'{len(self.queries)} queries, budget is {budget}')
+        for sql, count, origins in self.repeated(threshold):
+            problems.append(f'{count}x {sql}\n    from {"; ".join(origins)}')
+        return problems
+
+
+@contextmanager
+def assert_query_budget(budget=None, threshold=None):
+    """
+    Test helper: raise ``QueryBudgetExceeded`` if the block runs more than
+    ``budget`` queries or repeats a query fingerprint ``threshold`` times.
+
+        with assert_query_budget(5):
+            self.client.get('/api/orders/')
+    """
+    recorder = QueryRecorder()
+    with recorder.record():
+        yield recorder
+    problems = recorder.problems(budget, threshold)
+    if problems:
+        raise QueryBudgetExceeded('\n'.join(problems))
@@ -1,6 +1,6 @@
+from django.db import transaction
 from rest_framework import serializers
-from django.contrib.auth.models import User
-from .models import *
+from .models import Order, OrderItem, Product, User, Wishlist
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
@@ -8,6 +8,8 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'price', 'stock', 'created_at']
 
 class OrderItemSerializer(serializers.ModelSerializer):
+    # Validated as a plain id; OrderSerializer checks all products of an order in one query.
+    product = serializers.UUIDField(source='product_id')
     product_name = serializers.ReadOnlyField(source='product.name')
 
     class Meta:
@@ -21,17 +23,25 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['id', 'user', 'total_price', 'status', 'created_at', 'items']
+
+    def validate_items(self, items):
+        products = Product.objects.in_bulk({item['product_id'] for item in items})
+        if all(item['product_id'] in products for item in items):
+            return items
+        # Same per-item shape and message as the PrimaryKeyRelatedField this replaces.
+        does_not_exist = serializers.PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+        raise serializers.ValidationError([
+            {} if item['product_id'] in products
+            else {'product': [does_not_exist.format(pk_value=item['product_id'])]}
+            for item in items
+        ])
     
     def create(self, validated_data):
         items_data = validated_data.pop('items')
-        order = Order.objects.create(**validated_data)
-        total_price = 0
-        for item_data in items_data:
-            OrderItem.objects.create(order=order, **item_data)
-            total_price += item_data['price'] * item_data['quantity']
-        
-        order.total_price = total_price
-        order.save()
+        total_price = sum(item_data['price'] * item_data['quantity'] for item_data in items_data)
+        with transaction.atomic():
+            order = Order.objects.create(total_price=total_price, **validated_data)
+            OrderItem.objects.bulk_create(OrderItem(order=order, **item_data) for item_data in items_data)
         return order
 
 class WishlistSerializer(serializers.ModelSerializer):
@@ -45,6 +55,21 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'password', 'phone_number', 'address']
-    
-    
+        extra_kwargs = {'password': {'write_only': True}}
+
+    def create(self, validated_data):
+        return User.objects.create_user(**validated_data)
+
+
+class ProfileSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'phone_number', 'address']
+        read_only_fields = ['id', 'username']
 
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
@@ -0,0 +1,39 @@
+from functools import partial
+
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .cache import bump_profile_version, clear_group_ids, get_profile_cache
+from .models import Order, User
+from .orderfeed import publish_order_status
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_profile_cache(sender, instance, **kwargs):
+    profile_cache = get_profile_cache()
+    if profile_cache is not None:
+        bump_profile_version(profile_cache, instance.pk)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_ids(sender, **kwargs):
+    clear_group_ids()
+
+
+@receiver(post_migrate)
+def invalidate_group_ids_after_migrate(sender, **kwargs):
+    # Migrations (and flushes between tests) can recreate groups under new ids.
+    clear_group_ids()
+
+
+@receiver(post_save, sender=Order)
+def publish_order_save(sender, instance, created, update_fields=None, **kwargs):
+    # Covers the status endpoint as well as the admin and any other save();
+    # QuerySet.update() bypasses it. Nobody can be subscribed to a new order.
+    if created or (update_fields is not None and 'status' not in update_fields):
+        return
+    transaction.on_commit(partial(publish_order_status, instance))
@@ -0,0 +1,250 @@
+"""
+Server-sent events stream of an order's status (GET /api/orders/<uuid>/events/).
+
+Served as a bare ASGI app in front of Django (see ``with_order_events`` in
+myproject/asgi.py) rather than as a Django view: Django's ASGI handler keeps
+a thread and a database connection for every open request, so tens of
+thousands of idle streams would mean as many threads and connections. Here
+an idle subscriber is a coroutine and a ``Subscription``.
+
+Requests to this URL skip the Django middleware stack, so the CORS headers
+of django-cors-headers (CORS_* settings) are added here, preflights included.
+
+Authentication is the usual ``Authorization: Bearer <access token>`` header.
+The browser's native ``EventSource`` cannot send headers, so the access
+token is also accepted as a query parameter::
+
+    new EventSource(`/api/orders/${id}/events/?token=${accessToken}`)
+
+Query strings end up in access logs; clients that can set headers (a
+fetch()-based event-stream reader) should prefer the header.
+
+A stream is closed after ORDER_FEED_MAX_LIFETIME seconds. Its first chunk
+carries a ``retry:`` hint, so EventSource reconnects and receives the
+current status again. Streams are also closed when the server shuts down:
+uvicorn waits for open responses before it sends ``lifespan.shutdown``, so
+SIGTERM/SIGINT themselves end the streams (see ``_lifespan``).
+"""
+
+import asyncio
+import io
+import json
+import random
+import signal
+
+from asgiref.sync import sync_to_async
+from corsheaders.middleware import CorsMiddleware
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .models import Order
+from .orderfeed import get_broker, order_channel
+
+FINAL_ORDER_STATUSES = ('delivered', 'cancelled')
+
+EVENT_STREAM_HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+
+# Only its CORS decisions are used; responses here never pass through it.
+_cors = CorsMiddleware(get_response=None)
+
+
+def _cors_headers(request, response=None):
+    """ASGI headers django-cors-headers would add to ``response`` for ``request``."""
+    response = _cors.add_response_headers(request, response or HttpResponse())
+    return [
+        (name.lower().encode('latin-1'), value.encode('latin-1'))
+        for name, value in response.items()
+        if name.lower() == 'vary' or name.lower().startswith('access-control-')
+    ]
+
+
+def _order_for_events(request, pk):
+    """
+    Authenticate the JWT and check the caller may watch the order (Manager
+    or owner). Returns ``(order, None)`` or ``(None, (status, error))``.
+    """
+    try:
+        authentication = JWTAuthentication()
+        header = authentication.get_header(request)
+        if header:
+            raw_token = authentication.get_raw_token(header)
+        else:
+            raw_token = request.GET.get('token', '').encode() or None
+        if raw_token is None:
+            return None, (status.HTTP_401_UNAUTHORIZED, "Authentication required")
+        user = authentication.get_user(authentication.get_validated_token(raw_token))
+
+        order = Order.objects.filter(pk=pk).only('id', 'user_id', 'status').first()
+        if order is None:
+            return None, (status.HTTP_404_NOT_FOUND, "Not found")
+        user_groups = user.groups.values_list('name', flat=True)
+        if 'Manager' not in user_groups and order.user_id != user.pk:
+            return None, (status.HTTP_403_FORBIDDEN, "Permission denied")
+        return order, None
+    except AuthenticationFailed:
+        return None, (status.HTTP_401_UNAUTHORIZED, "Authentication required")
+    finally:
+        # Runs on a shared executor thread, outside Django's request cycle.
+        close_old_connections()
+
+
+def _start_broker(broker):
+    try:
+        broker.start()
+    finally:
+        close_old_connections()
+
+
+def _event(message):
+    return f"event: status\ndata: {json.dumps(message)}\n\n".encode()
+
+
+async def _send_error(send, status_code, error, headers):
+    await send({
+        'type': 'http.response.start',
+        'status': status_code,
+        'headers': [(b'content-type', b'application/json'), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps({"error": error}).encode()})
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def order_events(scope, receive, send, pk):
+    """
+    Send the order's current status, then every change published when the
+    order is saved, until the order is delivered or cancelled,
+    the stream reaches its maximum lifetime, the server shuts down or the
+    client goes away.
+    """
+    request = ASGIRequest(scope, io.BytesIO())
+    preflight = _cors.check_preflight(request)
+    if preflight is not None:
+        await send({
+            'type': 'http.response.start',
+            'status': status.HTTP_200_OK,
+            'headers': [(b'content-length', b'0'), *_cors_headers(request, preflight)],
+        })
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    cors_headers = _cors_headers(request)
+    if request.method != 'GET':
+        await _send_error(send, status.HTTP_405_METHOD_NOT_ALLOWED, "Method not allowed", cors_headers)
+        return
+
+    broker = get_broker()
+    if not broker.started:
+        await sync_to_async(_start_broker, thread_sensitive=False)(broker)
+    # Subscribe before reading the current status so no change is missed in between.
+    with broker.hub.subscribe(order_channel(pk)) as subscription:
+        order, error = await sync_to_async(_order_for_events, thread_sensitive=False)(request, pk)
+        if error is not None:
+            await _send_error(send, *error, cors_headers)
+            return
+
+        loop = asyncio.get_running_loop()
+        # Jittered so that clients which reconnected together (after a restart)
+        # do not all reconnect together again.
+        deadline = loop.time() + settings.ORDER_FEED_MAX_LIFETIME * random.uniform(0.8, 1)
+        await send({'type': 'http.response.start', 'status': status.HTTP_200_OK, 'headers': [*EVENT_STREAM_HEADERS, *cors_headers]})
+        current = order.status
+        await send({
+            'type': 'http.response.body',
+            'body': f'retry: {settings.ORDER_FEED_RETRY * 1000}\n\n'.encode() + _event({'id': str(order.pk), 'status': current}),
+            'more_body': True,
+        })
+
+        disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+        try:
+            while current not in FINAL_ORDER_STATUSES and not subscription.closed:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                timeout = min(settings.ORDER_FEED_HEARTBEAT, remaining)
+                message = asyncio.ensure_future(subscription.get(timeout=timeout))
+                await asyncio.wait((message, disconnected), return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    message.cancel()
+                    return
+                message = message.result()
+                if message is not None:
+                    # Every save of the order is published, not only status changes.
+                    if message['status'] != current:
+                        current = message['status']
+                        await send({'type': 'http.response.body', 'body': _event(message), 'more_body': True})
+                elif timeout < remaining and not subscription.closed:
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+
+
+def _close_streams_on_exit_signals(loop):
+    """
+    Chain the server's SIGINT/SIGTERM handlers so that a shutdown also ends
+    every open stream; the server would otherwise wait for them to finish.
+    """
+    hub = get_broker().hub
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(signum)
+        if not callable(previous):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            loop.call_soon_threadsafe(hub.close_all)
+            previous(signum, frame)
+
+        try:
+            signal.signal(signum, handler)
+        except ValueError:
+            # Not the main thread; the maximum stream lifetime still applies.
+            return
+
+
+async def _lifespan(receive, send):
+    # Django's ASGI handler does not implement the lifespan protocol.
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await sync_to_async(_start_broker, thread_sensitive=False)(get_broker())
+            _close_streams_on_exit_signals(asyncio.get_running_loop())
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            get_broker().hub.close_all()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def with_order_events(application):
+    """Wrap the Django ASGI application so the order-events URL is served by ``order_events``."""
+
+    async def router(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await _lifespan(receive, send)
+            return
+        if scope['type'] == 'http' and scope['path'].endswith('/events/'):
+            try:
+                match = resolve(scope['path'])
+            except Resolver404:
+                match = None
+            if match is not None and match.url_name == 'order-events':
+                await order_events(scope, receive, send, match.kwargs['pk'])
+                return
+        await application(scope, receive, send)
+
+    return router
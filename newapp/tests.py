@@ -1,3 +1,608 @@
-from django.test import TestCase
+import asyncio
+import json
+import runpy
+import signal
+import subprocess
+import tempfile
+import threading
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import Group
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import clear_url_caches, get_resolver, path
+from django.utils import timezone
+from django.utils.translation import get_language
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .cache import clear_group_ids, get_group_id, get_profile_version, profile_cache_key
+from .decorators import query_budget
+from .models import FeedMessage, Order, OrderItem, Product, User
+from .orderfeed import DatabaseBroker, Hub, LocalBroker, get_broker
+from .querybudget import QueryBudgetExceeded, assert_query_budget, fingerprint
+from .serializer import ProfileSerializer
+from .sse import _close_streams_on_exit_signals, with_order_events
+from .warmup import warm_up
+
+
+# Views for the middleware tests, served through ROOT_URLCONF='newapp.tests'.
+
+@query_budget(2)
+def over_budget_view(request):
+    for _ in range(3):
+        User.objects.exists()
+    return HttpResponse()
+
+
+@query_budget(GET=1)
+def repeated_query_view(request):
+    # One query per product: the N+1 the detector looks for.
+    for product in Product.objects.all():
+        OrderItem.objects.filter(product=product).count()
+    return HttpResponse()
+
+
+urlpatterns = [
+    path('over-budget/', over_budget_view),
+    path('repeated/', repeated_query_view),
+]
+
+
+def create_user(username, group):
+    user = User.objects.create_user(username=username, password='secret')
+    User.groups.through.objects.create(user_id=user.pk, group_id=get_group_id(group))
+    return user
+
+
+def api_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    return client
+
+
+IMPORTTIME_STDERR = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 |   _io
+import time:      3000 |       3000 |     django.utils
+import time:      2000 |       5000 |   django
+import time:      7500 |       7500 |     rest_framework.fields
+import time:       500 |       8000 |   rest_framework
+"""
+
+
+class ImportTimeCommandTests(SimpleTestCase):
+    def run_command(self, *args, stderr=IMPORTTIME_STDERR, returncode=0):
+        result = subprocess.CompletedProcess(args=[], returncode=returncode, stdout='', stderr=stderr)
+        stdout = StringIO()
+        with mock.patch('newapp.management.commands.importtime.subprocess.run', return_value=result):
+            call_command('importtime', *args, stdout=stdout)
+        return [line.split() for line in stdout.getvalue().splitlines()[1:] if line]
+
+    def test_sorted_by_cumulative_time(self):
+        rows = self.run_command('--limit', '2')
+        self.assertEqual(rows[:2], [['0.5', '8.0', 'rest_framework'], ['7.5', '7.5', 'rest_framework.fields']])
+        self.assertEqual(rows[-1], ['Total', 'import', 'time:', '13.1', 'ms'])
+
+    def test_sorted_by_self_time(self):
+        rows = self.run_command('--sort', 'self', '--limit', '2')
+        self.assertEqual(rows[:2], [['7.5', '7.5', 'rest_framework.fields'], ['3.0', '3.0', 'django.utils']])
+
+    def test_by_package(self):
+        rows = self.run_command('--by-package', '--sort', 'self')
+        self.assertEqual(
+            [row[2] for row in rows[:3]] + [row[0] for row in rows[:3]],
+            ['rest_framework', 'django', '_io', '8.0', '5.0', '0.1'],
+        )
+
+    def test_failed_import(self):
+        with self.assertRaisesMessage(CommandError, 'ModuleNotFoundError'):
+            self.run_command(stderr='ModuleNotFoundError: No module named x', returncode=1)
+
+
+class WarmUpTests(SimpleTestCase):
+    def test_fills_the_url_resolver(self):
+        clear_url_caches()
+        self.addCleanup(clear_url_caches)
+        warm_up()
+        resolver = get_resolver()
+        self.assertTrue(resolver._populated)
+        self.assertIn('order-events', resolver._reverse_dict[get_language()])
+
+
+class FingerprintTests(TestCase):
+    def test_strings_and_numbers(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE name = 'O''Brien' AND price > 12.50 LIMIT 21"),
+            'SELECT * FROM t WHERE name = ? AND price > ? LIMIT ?',
+        )
+
+    def test_placeholders(self):
+        self.assertEqual(fingerprint('SELECT * FROM t WHERE a = %s AND b = ?'), 'SELECT * FROM t WHERE a = ? AND b = ?')
+
+    def test_in_lists_of_any_length(self):
+        self.assertEqual(fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)'), 'SELECT * FROM t WHERE id IN (...)')
+        self.assertEqual(fingerprint("SELECT * FROM t WHERE id IN (1,'a')"), 'SELECT * FROM t WHERE id IN (...)')
+
+    def test_identifiers_keep_their_digits(self):
+        self.assertEqual(
+            fingerprint('SELECT "t2"."col_1" FROM "newapp_table2" "t2" WHERE "t2"."id" = 7'),
+            'SELECT "t2"."col_1" FROM "newapp_table2" "t2" WHERE "t2"."id" = ?',
+        )
+
+    def test_whitespace(self):
+        self.assertEqual(fingerprint('  SELECT *\n  FROM   t '), 'SELECT * FROM t')
+
+
+@override_settings(ROOT_URLCONF='newapp.tests', QUERY_BUDGET_RAISE=True)
+class QueryBudgetMiddlewareTests(TestCase):
+    def test_budget_overrun_raises(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, '3 queries, budget is 2'):
+            self.client.get('/over-budget/')
+
+    def test_repeated_fingerprint_raises(self):
+        for name in 'abc':
+            Product.objects.create(name=name, price=1)
+        with self.assertRaisesMessage(QueryBudgetExceeded, '3x SELECT COUNT(*)') as raised:
+            self.client.post('/repeated/')
+        # The offending line of project code is named.
+        self.assertIn('newapp/tests.py', str(raised.exception))
+
+    @override_settings(QUERY_BUDGET_RAISE=False)
+    def test_logs_instead_of_raising(self):
+        with self.assertLogs('newapp.middleware', 'WARNING'):
+            response = self.client.get('/over-budget/')
+        self.assertEqual(response.status_code, 200)
+
+
+class AssertQueryBudgetTests(TestCase):
+    def test_within_budget(self):
+        with assert_query_budget(1) as recorder:
+            User.objects.exists()
+        self.assertEqual(len(recorder.queries), 1)
+
+    def test_over_budget(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with assert_query_budget(1):
+                User.objects.exists()
+                User.objects.exists()
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class OrderQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = create_user('manager', 'Manager')
+        cls.customer = create_user('customer', 'Customer')
+        cls.products = [Product.objects.create(name=f'Product {i}', price=i + 1) for i in range(6)]
+
+    def create_orders(self, count, items):
+        for _ in range(count):
+            order = Order.objects.create(user=self.customer)
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product=product, quantity=1, price=product.price)
+                for product in self.products[:items]
+            )
+        return order
+
+    def count_queries(self, client, url):
+        with assert_query_budget(5) as recorder:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(recorder.queries)
+
+    def test_order_list_is_flat(self):
+        client = api_client(self.manager)
+        self.create_orders(1, items=1)
+        small = self.count_queries(client, '/api/orders/')
+        self.create_orders(5, items=6)
+        self.assertEqual(self.count_queries(client, '/api/orders/'), small)
+
+    def test_order_detail_is_flat(self):
+        client = api_client(self.customer)
+        small = self.count_queries(client, f'/api/orders/{self.create_orders(1, items=1).pk}/')
+        large = self.count_queries(client, f'/api/orders/{self.create_orders(1, items=6).pk}/')
+        self.assertEqual(large, small)
+
+    def test_create_order(self):
+        client = api_client(self.customer)
+        items = [{'product': str(product.pk), 'quantity': 2, 'price': '1.50'} for product in self.products]
+        response = client.post('/api/orders/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.data['total_price']), Decimal('18.00'))
+        self.assertEqual(
+            sorted(item['product_name'] for item in response.data['items']),
+            [product.name for product in self.products],
+        )
+
+    def test_create_order_unknown_product(self):
+        client = api_client(self.customer)
+        unknown = '00000000-0000-0000-0000-000000000000'
+        items = [
+            {'product': str(self.products[0].pk), 'quantity': 1, 'price': '1.00'},
+            {'product': unknown, 'quantity': 1, 'price': '1.00'},
+        ]
+        response = client.post('/api/orders/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {'items': [{}, {'product': [f'Invalid pk "{unknown}" - object does not exist.']}]},
+        )
+        self.assertFalse(Order.objects.exists())
+
+
+class GroupIdTests(TestCase):
+    def test_registration_assigns_customer(self):
+        response = APIClient().post('/api/register/', {'username': 'new', 'password': 'secret'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertQuerySetEqual(User.objects.get(username='new').groups.values_list('name', flat=True), ['Customer'])
+
+    def test_cleared_when_a_group_is_saved(self):
+        get_group_id('Customer')
+        Group.objects.create(name='Auditor')
+        with self.assertNumQueries(1):
+            get_group_id('Customer')
+
+    def test_cleared_when_a_group_is_deleted(self):
+        # The rollback after the test restores the group without a signal.
+        self.addCleanup(clear_group_ids)
+        customer_id = get_group_id('Customer')
+        Group.objects.filter(pk=customer_id).delete()
+        self.assertNotEqual(get_group_id('Customer'), customer_id)
+
+
+class ProfileCacheTests(TestCase):
+    def setUp(self):
+        self.user = create_user('customer', 'Customer')
+        self.client = api_client(self.user)
+
+    def shared_cache(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        return self.settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir.name},
+        })
+
+    def cached_profile(self):
+        profile_cache = caches['default']
+        return profile_cache.get(profile_cache_key(self.user.pk, get_profile_version(profile_cache, self.user.pk)))
+
+    def test_not_cached_in_process_local_cache(self):
+        self.client.get('/api/profile/')
+        self.assertIsNone(self.cached_profile())
+
+    def test_shared_cache_is_invalidated_on_save(self):
+        with self.shared_cache():
+            self.client.get('/api/profile/')
+            self.assertEqual(self.cached_profile()['username'], 'customer')
+
+            response = self.client.put('/api/profile/', {'first_name': 'Ada'}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(self.cached_profile())
+            self.assertEqual(self.client.get('/api/profile/').data['first_name'], 'Ada')
+
+    @override_settings(QUERY_BUDGET_RAISE=False)
+    def test_save_during_get_is_not_overwritten(self):
+        # The GET has loaded (and is serializing) the old user when the save
+        # lands; the copy it caches afterwards must not be served.
+        to_representation = ProfileSerializer.to_representation
+
+        def save_then_serialize(serializer, instance):
+            fresh = User.objects.get(pk=self.user.pk)
+            fresh.first_name = 'Ada'
+            fresh.save()
+            return to_representation(serializer, instance)
+
+        with self.shared_cache():
+            with mock.patch.object(ProfileSerializer, 'to_representation', save_then_serialize):
+                # The save's queries run inside the GET and exceed its budget.
+                with self.assertLogs('newapp.middleware', 'WARNING'):
+                    self.assertEqual(self.client.get('/api/profile/').data['first_name'], '')
+            self.assertEqual(self.client.get('/api/profile/').data['first_name'], 'Ada')
+
+
+class HubTests(SimpleTestCase):
+    async def test_dispatch_reaches_channel_subscribers(self):
+        hub = Hub()
+        with hub.subscribe('order:1') as first, hub.subscribe('order:1') as second, hub.subscribe('order:2') as other:
+            self.assertEqual(hub.subscriber_count(), 3)
+            hub.dispatch('order:1', {'status': 'paid'})
+            self.assertEqual(await first.get(timeout=1), {'status': 'paid'})
+            self.assertEqual(await second.get(timeout=1), {'status': 'paid'})
+            self.assertIsNone(await other.get(timeout=0.01))
+
+    async def test_unsubscribe(self):
+        hub = Hub()
+        subscription = hub.subscribe('order:1')
+        subscription.close()
+        self.assertEqual(hub.subscriber_count(), 0)
+        hub.dispatch('order:1', {'status': 'paid'})
+        self.assertIsNone(await subscription.get(timeout=0.01))
+
+    async def test_dispatch_from_another_thread(self):
+        hub = Hub()
+        with hub.subscribe('order:1') as subscription:
+            thread = threading.Thread(target=hub.dispatch, args=('order:1', {'status': 'shipped'}))
+            thread.start()
+            self.assertEqual(await subscription.get(timeout=1), {'status': 'shipped'})
+            thread.join()
+
+    async def test_get_keeps_only_the_latest_message(self):
+        hub = Hub()
+        with hub.subscribe('order:1') as subscription:
+            for new_status in ('paid', 'shipped', 'delivered'):
+                hub.dispatch('order:1', {'status': new_status})
+            await asyncio.sleep(0)
+            self.assertEqual(await subscription.get(timeout=1), {'status': 'delivered'})
+            self.assertIsNone(await subscription.get(timeout=0.01))
+
+    async def test_close_all_wakes_subscribers(self):
+        hub = Hub()
+        with hub.subscribe('order:1') as waiting, hub.subscribe('order:2') as pending:
+            hub.dispatch('order:2', {'status': 'paid'})
+            waiter = asyncio.ensure_future(waiting.get())
+            await asyncio.sleep(0)
+            hub.close_all()
+            self.assertIsNone(await asyncio.wait_for(waiter, 1))
+            self.assertTrue(waiting.closed)
+            # A message that arrived before the shutdown is still handed out.
+            self.assertEqual(await pending.get(), {'status': 'paid'})
+            self.assertIsNone(await pending.get())
+        with hub.subscribe('order:3') as late:
+            self.assertTrue(late.closed)
+
+
+def fallback_application(scope, receive, send):
+    raise AssertionError(f'{scope["path"]} reached the Django application')
+
+
+class EventStream:
+    """Drives one request through ``with_order_events`` like an ASGI server."""
+
+    def __init__(self, path, method='GET', headers=(), query_string=b''):
+        self.requests = asyncio.Queue()
+        self.messages = asyncio.Queue()
+        scope = {
+            'type': 'http', 'method': method, 'path': path, 'root_path': '', 'query_string': query_string,
+            'headers': [(name.encode(), value.encode()) for name, value in headers],
+            'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+        }
+        self.task = asyncio.ensure_future(
+            with_order_events(fallback_application)(scope, self.requests.get, self.messages.put)
+        )
+
+    async def receive(self):
+        return await asyncio.wait_for(self.messages.get(), 5)
+
+    async def start(self):
+        start = await self.receive()
+        return start['status'], {name.decode(): value.decode() for name, value in start['headers']}
+
+    async def body(self):
+        return (await self.receive())['body']
+
+    async def event(self):
+        lines = (await self.body()).decode().splitlines()
+        return json.loads(next(line for line in lines if line.startswith('data: ')).removeprefix('data: '))
+
+    async def end(self):
+        final = await self.receive()
+        await asyncio.wait_for(self.task, 5)
+        return final
+
+    async def disconnect(self):
+        await self.requests.put({'type': 'http.disconnect'})
+        await asyncio.wait_for(self.task, 5)
+
+
+class OrderEventsTests(TransactionTestCase):
+    # The stream reads the database on another thread, so the data has to be committed.
+
+    def setUp(self):
+        self.manager = create_user('manager', 'Manager')
+        self.customer = create_user('customer', 'Customer')
+        self.other = create_user('other', 'Customer')
+        self.order = Order.objects.create(user=self.customer)
+        self.path = f'/api/orders/{self.order.pk}/events/'
+
+    def auth(self, user):
+        return [('authorization', f'Bearer {RefreshToken.for_user(user).access_token}')]
+
+    async def error(self, *args, **kwargs):
+        stream = EventStream(*args, **kwargs)
+        status_code, _ = await stream.start()
+        body = json.loads(await stream.body())
+        await asyncio.wait_for(stream.task, 5)
+        return status_code, body['error']
+
+    async def test_errors(self):
+        customer = await sync_to_async(self.auth)(self.customer)
+        other = await sync_to_async(self.auth)(self.other)
+        self.assertEqual(await self.error(self.path, method='POST', headers=customer), (405, 'Method not allowed'))
+        self.assertEqual(await self.error(self.path), (401, 'Authentication required'))
+        self.assertEqual(
+            await self.error(self.path, headers=[('authorization', 'Bearer nonsense')]),
+            (401, 'Authentication required'),
+        )
+        self.assertEqual(await self.error(self.path, headers=other), (403, 'Permission denied'))
+        missing = '/api/orders/00000000-0000-0000-0000-000000000000/events/'
+        self.assertEqual(await self.error(missing, headers=customer), (404, 'Not found'))
+        self.assertEqual(get_broker().hub.subscriber_count(), 0)
+
+    async def test_cors_preflight(self):
+        stream = EventStream(self.path, method='OPTIONS', headers=[
+            ('origin', 'http://localhost:3000'),
+            ('access-control-request-method', 'GET'),
+            ('access-control-request-headers', 'authorization'),
+        ])
+        status_code, headers = await stream.start()
+        self.assertEqual(status_code, 200)
+        self.assertEqual(headers['access-control-allow-origin'], 'http://localhost:3000')
+        self.assertIn('authorization', headers['access-control-allow-headers'])
+        self.assertIn('GET', headers['access-control-allow-methods'])
+        await asyncio.wait_for(stream.task, 5)
+
+    async def test_streams_status_changes_until_delivered(self):
+        manager_client = await sync_to_async(api_client)(self.manager)
+        token = await sync_to_async(RefreshToken.for_user)(self.customer)
+        # Query-string token, as sent by the browser's EventSource.
+        stream = EventStream(
+            self.path, headers=[('origin', 'http://localhost:3000')],
+            query_string=f'token={token.access_token}'.encode(),
+        )
+        status_code, headers = await stream.start()
+        self.assertEqual(status_code, 200)
+        self.assertEqual(headers['content-type'], 'text/event-stream')
+        self.assertEqual(headers['access-control-allow-origin'], 'http://localhost:3000')
+        self.assertEqual(await stream.event(), {'id': str(self.order.pk), 'status': 'pending'})
+
+        for new_status in ('paid', 'delivered'):
+            response = await sync_to_async(manager_client.patch)(
+                f'/api/orders/{self.order.pk}/status/', {'status': new_status}, format='json'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(await stream.event(), {'id': str(self.order.pk), 'status': new_status})
+
+        final = await stream.receive()
+        self.assertFalse(final.get('more_body', False))
+        await asyncio.wait_for(stream.task, 5)
+        self.assertEqual(get_broker().hub.subscriber_count(), 0)
+
+    async def test_stream_ends_after_max_lifetime(self):
+        with self.settings(ORDER_FEED_MAX_LIFETIME=0.2, ORDER_FEED_RETRY=3):
+            stream = EventStream(self.path, headers=await sync_to_async(self.auth)(self.customer))
+            self.assertEqual((await stream.start())[0], 200)
+            self.assertTrue((await stream.body()).startswith(b'retry: 3000\n\n'))
+            self.assertEqual(await stream.end(), {'type': 'http.response.body', 'body': b''})
+        self.assertEqual(get_broker().hub.subscriber_count(), 0)
+
+    async def test_shutdown_ends_streams(self):
+        broker = LocalBroker(Hub())
+        with mock.patch('newapp.sse.get_broker', return_value=broker):
+            stream = EventStream(self.path, headers=await sync_to_async(self.auth)(self.customer))
+            self.assertEqual((await stream.start())[0], 200)
+            await stream.event()
+            broker.hub.close_all()
+            self.assertEqual(await stream.end(), {'type': 'http.response.body', 'body': b''})
+        self.assertEqual(broker.hub.subscriber_count(), 0)
+
+    async def test_disconnect_unsubscribes(self):
+        stream = EventStream(self.path, headers=await sync_to_async(self.auth)(self.manager))
+        self.assertEqual((await stream.start())[0], 200)
+        await stream.event()
+        self.assertEqual(get_broker().hub.subscriber_count(), 1)
+        await stream.disconnect()
+        self.assertEqual(get_broker().hub.subscriber_count(), 0)
+
+
+class LifespanTests(SimpleTestCase):
+    def setUp(self):
+        self.broker = LocalBroker(Hub())
+        patcher = mock.patch('newapp.sse.get_broker', return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+
+    def test_exit_signal_closes_the_hub(self):
+        server_handler = mock.Mock()
+        signal.signal(signal.SIGTERM, server_handler)
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        _close_streams_on_exit_signals(loop)
+        signal.raise_signal(signal.SIGTERM)
+        loop.run_until_complete(asyncio.sleep(0))
+
+        server_handler.assert_called_once()
+        self.assertTrue(loop.run_until_complete(self.subscribe_closed()))
+
+    async def subscribe_closed(self):
+        with self.broker.hub.subscribe('order:1') as subscription:
+            return subscription.closed
+
+    async def test_lifespan_shutdown_closes_the_hub(self):
+        requests = asyncio.Queue()
+        messages = asyncio.Queue()
+        for message in ('lifespan.startup', 'lifespan.shutdown'):
+            await requests.put({'type': message})
+        await with_order_events(fallback_application)({'type': 'lifespan'}, requests.get, messages.put)
+        self.assertEqual((await messages.get())['type'], 'lifespan.startup.complete')
+        self.assertEqual((await messages.get())['type'], 'lifespan.shutdown.complete')
+        self.assertTrue(await self.subscribe_closed())
+
+
+class DatabaseBrokerTests(TestCase):
+    def setUp(self):
+        self.broker = DatabaseBroker(mock.Mock())
+
+    def dispatched(self):
+        calls = [call.args for call in self.broker.hub.dispatch.call_args_list]
+        self.broker.hub.dispatch.reset_mock()
+        return calls
+
+    def test_start_skips_earlier_messages(self):
+        self.broker.publish('order:1', {'status': 'paid'})
+        with mock.patch('newapp.orderfeed.threading.Thread') as thread:
+            self.broker.start()
+            self.broker.start()
+        thread.return_value.start.assert_called_once()
+        self.broker.publish('order:1', {'status': 'shipped'})
+        self.broker.publish('order:2', {'status': 'paid'})
+        self.broker.poll()
+        self.assertEqual(self.dispatched(), [('order:1', {'status': 'shipped'}), ('order:2', {'status': 'paid'})])
+        self.broker.poll()
+        self.assertEqual(self.dispatched(), [])
+
+    def test_late_commits_of_skipped_ids(self):
+        self.broker.publish('order:1', {'status': 'paid'})
+        self.broker.poll()
+        last_id = FeedMessage.objects.get().pk
+        # Id last_id + 1 was taken by an insert that commits after last_id + 2.
+        FeedMessage.objects.create(id=last_id + 2, channel='order:2', message={'status': 'paid'})
+        self.broker.poll()
+        FeedMessage.objects.create(id=last_id + 1, channel='order:1', message={'status': 'shipped'})
+        self.broker.poll()
+        self.assertEqual(self.dispatched()[1:], [('order:2', {'status': 'paid'}), ('order:1', {'status': 'shipped'})])
+
+    def test_publish_prunes_old_messages(self):
+        self.broker.publish('order:1', {'status': 'paid'})
+        FeedMessage.objects.update(created_at=timezone.now() - self.broker.retention * 2)
+        self.broker._pruned_at = None
+        self.broker.publish('order:1', {'status': 'shipped'})
+        self.assertEqual(list(FeedMessage.objects.values_list('message', flat=True)), [{'status': 'shipped'}])
+
+
+class OrderSavePublishTests(TestCase):
+    def setUp(self):
+        self.order = Order.objects.create(user=create_user('customer', 'Customer'))
+
+    def test_saving_an_order_publishes_its_status(self):
+        with mock.patch('newapp.signals.publish_order_status') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.order.status = 'shipped'
+                self.order.save()
+        publish.assert_called_once_with(self.order)
+
+    def test_saves_without_status_are_not_published(self):
+        with mock.patch('newapp.signals.publish_order_status') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                Order.objects.create(user=self.order.user)
+                self.order.save(update_fields=['total_price'])
+        publish.assert_not_called()
+
+
+class GunicornConfigTests(SimpleTestCase):
+    def test_refuses_local_broker(self):
+        on_starting = runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))['on_starting']
+        with self.settings(ORDER_FEED_BROKER='newapp.orderfeed.LocalBroker'):
+            with self.assertRaisesMessage(RuntimeError, 'LocalBroker'):
+                on_starting(None)
+        with self.settings(ORDER_FEED_BROKER='newapp.orderfeed.DatabaseBroker'):
+            on_starting(None)
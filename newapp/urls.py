@@ -11,6 +11,7 @@ urlpatterns = [
     path('orders/', order_list_create_view, name='order-list-create'),
     path('orders/<uuid:pk>/', order_detail_view, name='order-detail'),
     path('orders/<uuid:pk>/status/', order_status_update_view, name='order-status-update'),
+    path('orders/<uuid:pk>/events/', order_events_view, name='order-events'),
 
     path('wishlist/', wishlist_list_create_view, name='wishlist-list-create'),
     path('wishlist/<uuid:pk>/', wishlist_delete_view, name='wishlist-delete'),
@@ -1,32 +1,32 @@
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from .models import *
+from .models import Order, Product, User, Wishlist
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
-from django.contrib.auth.models import Group
-from .serializer import *
-from .decorators import role_required
+from .cache import get_group_id, get_profile_cache, get_profile_version, profile_cache_key
+from .serializer import OrderSerializer, ProductSerializer, ProfileSerializer, UserSerializer, WishlistSerializer
+from .decorators import query_budget, role_required
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 
 # --- Authentication Views ---
 
+@query_budget(7)
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def registration_view(request):
-    serializer = ProfileSerializer(data=request.data)
+    serializer = UserSerializer(data=request.data)
     if serializer.is_valid():
-        profile = serializer.save()
-        user = profile.user
-        
-        # Assign default role 'Customer'
-        group, _ = Group.objects.get_or_create(name='Customer')
-        user.groups.add(group)
-        
-        # Create 'Manager' group just in case it's needed later
-        Group.objects.get_or_create(name='Manager')
+        # Default role 'Customer' (the groups are created by migration 0002). Looked up
+        # outside the transaction so a get_or_create there can't roll back with the user.
+        customer_group_id = get_group_id('Customer')
+        with transaction.atomic():
+            user = serializer.save()
+            User.groups.through.objects.create(user_id=user.pk, group_id=customer_group_id)
 
         # Generate Tokens
         refresh = RefreshToken.for_user(user)
@@ -37,6 +37,7 @@ def registration_view(request):
         }, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@query_budget(3)
 @api_view(['POST'])
 def login_view(request):
     username = request.data.get('username')
@@ -55,6 +56,7 @@ def login_view(request):
 
 # --- Product Views ---
 
+@query_budget(GET=2, POST=3)
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticatedOrReadOnly])
 def product_list_create_view(request):
@@ -75,6 +77,7 @@ def product_list_create_view(request):
         
         return create_product(request)
 
+@query_budget(GET=2, PUT=4, DELETE=8)
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def product_detail_view(request, pk):
@@ -104,30 +107,34 @@ def product_detail_view(request, pk):
 
 # --- Order Views ---
 
+@query_budget(GET=5, POST=9)
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def order_list_create_view(request):
     if request.method == 'GET':
         # Managers see all orders, Customers see their own
         user_groups = request.user.groups.values_list('name', flat=True)
-        if 'Manager' in user_groups:
-            orders = Order.objects.all()
-        else:
-            orders = Order.objects.filter(user=request.user)
+        orders = Order.objects.select_related('user').prefetch_related('items__product')
+        if 'Manager' not in user_groups:
+            orders = orders.filter(user=request.user)
         serializer = OrderSerializer(orders, many=True)
         return Response(serializer.data)
     
     elif request.method == 'POST':
         serializer = OrderSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            order = serializer.save(user=request.user)
+            order = Order.objects.select_related('user').prefetch_related('items__product').get(pk=order.pk)
+            return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@query_budget(5)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def order_detail_view(request, pk):
-    order = get_object_or_404(Order, pk=pk)
+    order = get_object_or_404(
+        Order.objects.select_related('user').prefetch_related('items__product'), pk=pk
+    )
     # Check permission: Manager or Owner
     user_groups = request.user.groups.values_list('name', flat=True)
     if 'Manager' not in user_groups and order.user != request.user:
@@ -136,6 +143,8 @@ def order_detail_view(request, pk):
     serializer = OrderSerializer(order)
     return Response(serializer.data)
 
+# Includes DatabaseBroker's insert of the status message and its occasional prune.
+@query_budget(6)
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
 @role_required(allowed_roles=['Manager'])
@@ -149,8 +158,15 @@ def order_status_update_view(request, pk):
     return Response({"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['GET'])
+def order_events_view(request, pk):
+    # Under ASGI this URL is answered by newapp.sse.order_events before it reaches Django.
+    return Response({"error": "Order events require an ASGI server"}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+
 # --- Wishlist Views ---
 
+@query_budget(GET=2, POST=6)
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def wishlist_list_create_view(request):
@@ -172,6 +188,7 @@ def wishlist_list_create_view(request):
         serializer = WishlistSerializer(wishlist_item)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+@query_budget(3)
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def wishlist_delete_view(request, pk):
@@ -182,19 +199,27 @@ def wishlist_delete_view(request, pk):
 
 # --- Profile Views ---
 
+@query_budget(GET=1, PUT=3)
 @api_view(['GET', 'PUT'])
 @permission_classes([IsAuthenticated])
 def profile_view(request):
-    profile = get_object_or_404(Profile, user=request.user)
-    
+    # request.user is the single-row User fetch done by JWT authentication,
+    # so the profile needs no further query.
     if request.method == 'GET':
-        serializer = ProfileSerializer(profile)
-        return Response(serializer.data)
+        profile_cache = get_profile_cache()
+        if profile_cache is None:
+            return Response(ProfileSerializer(request.user).data)
+        cache_key = profile_cache_key(request.user.pk, get_profile_version(profile_cache, request.user.pk))
+        data = profile_cache.get(cache_key)
+        if data is None:
+            data = dict(ProfileSerializer(request.user).data)
+            profile_cache.set(cache_key, data, settings.PROFILE_CACHE_TIMEOUT)
+        return Response(data)
     
     elif request.method == 'PUT':
-        serializer = ProfileSerializer(profile, data=request.data, partial=True)
+        # Saves only the submitted fields; the post_save signal bumps the profile's cache version.
+        serializer = ProfileSerializer(request.user, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
@@ -0,0 +1,43 @@
+from django.urls import get_resolver
+from rest_framework.settings import api_settings
+
+
+def warm_up():
+    """
+    Prime the per-process caches that otherwise get filled by the first
+    request a worker serves. Meant to run once in the gunicorn master
+    (with preload_app) so forked workers inherit the populated caches.
+    """
+    # URL resolver: imports the URLconf (views, serializers, admin) and
+    # builds the reverse/namespace dicts.
+    resolver = get_resolver()
+    resolver.reverse_dict
+    resolver.namespace_dict
+    resolver.app_dict
+
+    # DRF settings are resolved lazily; touching them imports the
+    # authentication/parser/renderer classes (simplejwt included).
+    api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    api_settings.DEFAULT_PERMISSION_CLASSES
+    api_settings.DEFAULT_PARSER_CLASSES
+    api_settings.DEFAULT_RENDERER_CLASSES
+
+    # Building serializer fields populates the model _meta caches and the
+    # DRF field-mapping imports used by every ModelSerializer.
+    from .serializer import (
+        OrderItemSerializer,
+        OrderSerializer,
+        ProductSerializer,
+        ProfileSerializer,
+        UserSerializer,
+        WishlistSerializer,
+    )
+    for serializer_class in (
+        ProductSerializer,
+        OrderItemSerializer,
+        OrderSerializer,
+        WishlistSerializer,
+        UserSerializer,
+        ProfileSerializer,
+    ):
+        serializer_class().fields